@@ -1,17 +1,41 @@
 import os
+import sys
 import io
 import csv
 import uuid
 import locale
-from flask import Flask, Response, render_template, request, redirect, url_for, flash
+import tempfile
+import threading
+from collections import namedtuple, Counter, OrderedDict
+import click
+import json
+import math
+import time
+import random
+import subprocess
+import tracemalloc
+import contextvars
+import unicodedata
+import logging
+import hashlib
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, g, jsonify, has_request_context, stream_with_context, session, make_response, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import date, timedelta
-from sqlalchemy import func
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, delete, update, select, literal, tuple_, event, or_, case, union_all, text, Integer
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.utils import get_column_letter
+from openpyxl.utils.exceptions import InvalidFileException
 
 # --- CONFIGURACIÓN DE IDIOMA ---
 try:
@@ -20,7 +44,8 @@ except locale.Error:
     try:
         locale.setlocale(locale.LC_TIME, 'Spanish')
     except locale.Error:
-        print("Advertencia: No se pudo configurar el idioma a español.")
+        # A stderr: 'flask bench' y 'flask export-orders' escriben JSON/CSV por stdout
+        print("Advertencia: No se pudo configurar el idioma a español.", file=sys.stderr)
 
 # --- CONFIGURACIÓN DE LA APP ---
 app = Flask(__name__)
@@ -37,6 +62,17 @@ if db_url.startswith("postgres://"):
 app.config['SECRET_KEY'] = SECRET_KEY_FROM_ENV
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['IDENTITY_CACHE_SIZE'] = int(os.environ.get('IDENTITY_CACHE_SIZE', 10000))
+app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get('IDENTITY_CACHE_TTL', 60))
+# Cada cuántos segundos un worker relee el sello de personal para descartar identidades cacheadas viejas
+app.config['IDENTITY_VERSION_CHECK_SECONDS'] = float(os.environ.get('IDENTITY_VERSION_CHECK_SECONDS', 2))
+app.config['PERF_METRICS_ENABLED'] = os.environ.get('PERF_METRICS_ENABLED', '1') not in ('0', 'false', 'False')
+app.config['PERF_REPEATED_STATEMENT_THRESHOLD'] = int(os.environ.get('PERF_REPEATED_STATEMENT_THRESHOLD', 5))
+# Procesos para hashear contraseñas en las importaciones; se crean dentro de la request, así que el valor por defecto es chico
+app.config['IMPORT_HASH_WORKERS'] = int(os.environ.get('IMPORT_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+app.config['EXCEL_CACHE_DIR'] = os.environ.get('EXCEL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'viandas_excel'))
+app.config['EXCEL_CACHE_MAX_BYTES'] = int(os.environ.get('EXCEL_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+app.config['ARCHIVE_HORIZON_DAYS'] = int(os.environ.get('ARCHIVE_HORIZON_DAYS', 180))
 
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
@@ -45,6 +81,7 @@ login_manager.login_view = 'login'
 # --- MODELOS (sin cambios) ---
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True); name = db.Column(db.String(100), nullable=False); email = db.Column(db.String(100), unique=True, nullable=False); legajo = db.Column(db.String(20), unique=True, nullable=True); password_hash = db.Column(db.String(128)); sector = db.Column(db.String(50)); role = db.Column(db.String(20), default='empleado')
+    __table_args__ = (db.Index('ix_user_role_sector_name', 'role', 'sector', 'name'),)
     @property
     def is_admin(self): return self.role == 'admin'
     def set_password(self, password): self.password_hash = generate_password_hash(password)
@@ -52,11 +89,29 @@ class User(UserMixin, db.Model):
 
 class Menu(db.Model):
     id = db.Column(db.Integer, primary_key=True); menu_date = db.Column(db.Date, nullable=False); menu_type = db.Column(db.String(50), nullable=False); description = db.Column(db.String(200), nullable=False)
+    __table_args__ = (db.Index('ix_menu_menu_date', 'menu_date'),)
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True); user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False); menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=True); order_date = db.Column(db.Date, nullable=False); meal_type = db.Column(db.String(10), nullable=False) 
     user = db.relationship('User', backref=db.backref('orders', lazy=True, cascade="all, delete-orphan")); menu = db.relationship('Menu', backref=db.backref('orders', lazy=True))
-    __table_args__ = (db.UniqueConstraint('user_id', 'order_date', name='_user_date_uc'),)
+    __table_args__ = (db.UniqueConstraint('user_id', 'order_date', name='_user_date_uc'), db.Index('ix_order_order_date', 'order_date'))
+
+class OrderArchive(db.Model):
+    # Pedidos fuera del horizonte operativo (flask archive-orders). Sin claves foráneas: el historial sobrevive a bajas de empleados y platos
+    id = db.Column(db.Integer, primary_key=True); user_id = db.Column(db.Integer, nullable=False); menu_id = db.Column(db.Integer, nullable=True); order_date = db.Column(db.Date, nullable=False); meal_type = db.Column(db.String(10), nullable=False)
+    __table_args__ = (db.Index('ix_order_archive_order_date', 'order_date'), db.Index('ix_order_archive_user_date', 'user_id', 'order_date'))
+
+class OrderWeekRollup(db.Model):
+    # Resumen por empleado y semana (lunes) de los pedidos archivados, para reportes históricos
+    user_id = db.Column(db.Integer, primary_key=True); week_start = db.Column(db.Date, primary_key=True); almuerzos = db.Column(db.Integer, nullable=False, default=0); cenas = db.Column(db.Integer, nullable=False, default=0); francos = db.Column(db.Integer, nullable=False, default=0)
+
+class MealCount(db.Model):
+    # Contador materializado de pedidos por (fecha, plato, turno); lo mantienen todas las escrituras sobre Order
+    count_date = db.Column(db.Date, primary_key=True); menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), primary_key=True); meal_type = db.Column(db.String(10), primary_key=True); total = db.Column(db.Integer, nullable=False, default=0)
+
+class DateVersion(db.Model):
+    # Sello por fecha: sube con cada escritura de pedidos o menús de ese día; versiona los reportes (ETag y caché de Excel)
+    stamp_date = db.Column(db.Date, primary_key=True); version = db.Column(db.Integer, nullable=False, default=0)
 
 class SystemSetting(db.Model):
     key = db.Column(db.String(50), primary_key=True); value = db.Column(db.String(100), nullable=False)
@@ -68,12 +123,160 @@ def format_date_spanish(dt, format_type='full'):
     elif format_type == 'abbr': return f"{dias[dt.isoweekday()][:3]} {dt.day}"
     return dt.strftime('%Y-%m-%d')
 
+# --- MÉTRICAS DE RENDIMIENTO ---
+# Por request: tiempo total, cantidad de sentencias SQL, tiempo en base y sentencias repetidas (patrón N+1).
+# Se devuelven en el header Server-Timing, se loguean en una línea JSON y se acumulan por endpoint para /admin/metrics.
+PERF_HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+perf_logger = logging.getLogger('viandas.perf')
+if not perf_logger.handlers: perf_logger.addHandler(logging.StreamHandler()); perf_logger.setLevel(logging.INFO); perf_logger.propagate = False
+
+class RequestPerf:
+    __slots__ = ('started', 'statements', 'db_seconds', 'statement_counts')
+    def __init__(self): self.started = time.perf_counter(); self.statements = 0; self.db_seconds = 0.0; self.statement_counts = Counter()
+
+class EndpointMetrics:
+    """Acumulado de un endpoint dentro de este worker."""
+    def __init__(self): self.requests = 0; self.total_ms = 0.0; self.max_ms = 0.0; self.statements = 0; self.db_ms = 0.0; self.histogram = [0] * (len(PERF_HISTOGRAM_BUCKETS_MS) + 1); self.repeated_statements = Counter()
+
+    def record(self, elapsed_ms, perf, repeated):
+        self.requests += 1; self.total_ms += elapsed_ms; self.max_ms = max(self.max_ms, elapsed_ms); self.statements += perf.statements; self.db_ms += perf.db_seconds * 1000
+        self.histogram[next((i for i, bound in enumerate(PERF_HISTOGRAM_BUCKETS_MS) if elapsed_ms <= bound), len(PERF_HISTOGRAM_BUCKETS_MS))] += 1
+        self.repeated_statements.update(repeated)
+
+    def as_dict(self):
+        histogram = [{'le_ms': bound, 'requests': count} for bound, count in zip(PERF_HISTOGRAM_BUCKETS_MS + (None,), self.histogram)]
+        return {'requests': self.requests, 'mean_ms': round(self.total_ms / self.requests, 2), 'max_ms': round(self.max_ms, 2), 'statements_mean': round(self.statements / self.requests, 2), 'db_ms_mean': round(self.db_ms / self.requests, 2), 'histogram': histogram, 'repeated_statements': [{'statement': statement, 'requests': count} for statement, count in self.repeated_statements.most_common(10)]}
+
+endpoint_metrics = {}
+_endpoint_metrics_lock = threading.Lock()
+_metrics_started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+def _perf_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and '_perf' in g: context._perf_started = time.perf_counter()
+
+def _perf_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_perf_started', None)
+    if started is None or not has_request_context(): return
+    perf = g.get('_perf')
+    if perf is not None: perf.statements += 1; perf.db_seconds += time.perf_counter() - started; perf.statement_counts[statement] += 1
+
+@app.before_request
+def start_request_perf():
+    if app.config['PERF_METRICS_ENABLED']: g._perf = RequestPerf()
+
+@app.after_request
+def finish_request_perf(response):
+    perf = g.pop('_perf', None)
+    if perf is None: return response
+    elapsed_ms = (time.perf_counter() - perf.started) * 1000; db_ms = perf.db_seconds * 1000
+    threshold = app.config['PERF_REPEATED_STATEMENT_THRESHOLD']; repeated = [' '.join(statement.split())[:200] for statement, count in perf.statement_counts.items() if count >= threshold]
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{perf.statements} sql", app;dur={elapsed_ms - db_ms:.1f}, total;dur={elapsed_ms:.1f}')
+    endpoint = request.endpoint or 'sin_endpoint'
+    with _endpoint_metrics_lock: endpoint_metrics.setdefault(endpoint, EndpointMetrics()).record(elapsed_ms, perf, repeated)
+    perf_logger.info(json.dumps({'endpoint': endpoint, 'method': request.method, 'path': request.path, 'status': response.status_code, 'ms': round(elapsed_ms, 2), 'sql': perf.statements, 'db_ms': round(db_ms, 2), 'repeated_sql': repeated}, ensure_ascii=False))
+    return response
+
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', _perf_before_cursor_execute); event.listen(db.engine, 'after_cursor_execute', _perf_after_cursor_execute)
+
+# --- CACHÉ DE IDENTIDAD ---
+class CachedIdentity(UserMixin):
+    """Copia liviana y desvinculada de la sesión del usuario logueado; es lo que las rutas ven como current_user."""
+    def __init__(self, user, version): self.id = user.id; self.name = user.name; self.role = user.role; self.sector = user.sector; self.legajo = user.legajo; self.version = version
+    @property
+    def is_admin(self): return self.role == 'admin'
+
+class IdentityCache:
+    """LRU acotado con vencimiento. Cada worker tiene el suyo; cada entrada lleva el sello personnel_version con el que se cargó.
+    El sello se relee de la base como mucho cada check_interval segundos, así que los cambios de personal hechos en otro worker
+    se ven en ese plazo sin que cada request consulte la base; el TTL queda como respaldo."""
+    def __init__(self, max_size, ttl, check_interval):
+        self.max_size = max_size; self.ttl = ttl; self.check_interval = check_interval; self._items = OrderedDict(); self._lock = threading.Lock()
+        self._version = None; self._version_checked_at = None
+
+    def current_version(self, load_version):
+        now = time.monotonic()
+        if self._version_checked_at is None or now - self._version_checked_at >= self.check_interval: self._version = load_version(); self._version_checked_at = now
+        return self._version
+
+    def get(self, user_id, version):
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None: return None
+            identity, expires_at = item
+            if expires_at < time.monotonic() or identity.version != version: del self._items[user_id]; return None
+            self._items.move_to_end(user_id); return identity
+
+    def put(self, identity):
+        with self._lock:
+            self._items[identity.id] = (identity, time.monotonic() + self.ttl); self._items.move_to_end(identity.id)
+            while len(self._items) > self.max_size: self._items.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id):
+        with self._lock: self._items.pop(user_id, None)
+
+identity_cache = IdentityCache(app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_TTL'], app.config['IDENTITY_VERSION_CHECK_SECONDS'])
+
 @login_manager.user_loader
-def load_user(user_id): return User.query.get(int(user_id))
+def load_user(user_id):
+    version = identity_cache.current_version(get_personnel_version); identity = identity_cache.get(int(user_id), version)
+    if identity is None:
+        user = db.session.get(User, int(user_id))
+        if user is None: return None
+        identity = identity_cache.put(CachedIdentity(user, version))
+    return identity
+
+# --- CACHÉ DE SEMANA ACTIVA Y MENÚ ---
+# Cada worker guarda la semana activa y el menú ya agrupado. La validez se controla con el sello 'data_version' de SystemSetting:
+# toda escritura que cambie la semana o el menú llama a bump_data_version() antes del commit y los demás workers lo ven en su próxima request.
+# Las altas, ediciones y bajas de personal cambian en cambio 'personnel_version' (bump_personnel_version), que usan la caché de identidad y los reportes.
+DATA_VERSION_KEY = 'data_version'
+PERSONNEL_VERSION_KEY = 'personnel_version'
+MenuItem = namedtuple('MenuItem', 'id menu_date menu_type description')
+_week_cache = {'version': None, 'entry': None}
+_week_cache_lock = threading.Lock()
+
+def get_setting_version(key):
+    # Una sola lectura por clave primaria por request
+    versions = g.setdefault('setting_versions', {})
+    if key not in versions: setting = db.session.get(SystemSetting, key); versions[key] = setting.value if setting else ''
+    return versions[key]
+
+def bump_setting_version(key):
+    setting = db.session.get(SystemSetting, key); new_version = uuid.uuid4().hex
+    if setting: setting.value = new_version
+    else: db.session.add(SystemSetting(key=key, value=new_version))
+    g.get('setting_versions', {}).pop(key, None)
+
+def get_data_version(): return get_setting_version(DATA_VERSION_KEY)
+def bump_data_version(): bump_setting_version(DATA_VERSION_KEY)
+def get_personnel_version(): return get_setting_version(PERSONNEL_VERSION_KEY)
+def bump_personnel_version(): bump_setting_version(PERSONNEL_VERSION_KEY)
+
+def _current_week_cache():
+    version = get_data_version()
+    with _week_cache_lock:
+        # Cada versión tiene su propio dict: una request que cargó datos con una versión vieja no puede ensuciar la nueva
+        if _week_cache['version'] != version: _week_cache.update(version=version, entry={'active_week': None, 'menus': {}})
+        return _week_cache['entry']
 
 def get_active_week():
-    setting = SystemSetting.query.get('week_start_date'); start_date = date.fromisoformat(setting.value) if setting else date(2025, 6, 23)
-    return [start_date + timedelta(days=i) for i in range(7)]
+    cache = _current_week_cache()
+    if cache['active_week'] is None:
+        setting = db.session.get(SystemSetting, 'week_start_date'); start_date = date.fromisoformat(setting.value) if setting else date(2025, 6, 23)
+        cache['active_week'] = tuple(start_date + timedelta(days=i) for i in range(7))
+    return list(cache['active_week'])
+
+def get_weekly_menu(week_dates):
+    # {fecha: (MenuItem, ...)} en orden de carga; las vistas no deben modificarlo
+    cache = _current_week_cache(); weekly_menu = cache['menus'].get(week_dates[0])
+    if weekly_menu is None:
+        grouped = {day: [] for day in week_dates}
+        for menu in Menu.query.filter(Menu.menu_date.between(week_dates[0], week_dates[-1])).order_by(Menu.id):
+            if menu.menu_date in grouped: grouped[menu.menu_date].append(MenuItem(menu.id, menu.menu_date, menu.menu_type, menu.description))
+        weekly_menu = cache['menus'][week_dates[0]] = {day: tuple(items) for day, items in grouped.items()}
+    return weekly_menu
 
 # --- RUTAS REESTRUCTURADAS ---
 
@@ -120,29 +323,92 @@ def employee_dashboard():
     # El contenido de esta función y todas las demás es el mismo que antes
     # ...
     if current_user.role != 'empleado': return redirect(url_for('index'))
-    week_dates = get_active_week(); start_date, end_date = week_dates[0], week_dates[-1]
-    menus_query = Menu.query.filter(Menu.menu_date.between(start_date, end_date)).all()
-    weekly_menu = {day: [m for m in menus_query if m.menu_date == day] for day in week_dates}
+    week_dates = get_active_week(); start_date, end_date = week_dates[0], week_dates[-1]; weekly_menu = get_weekly_menu(week_dates)
     orders_query = Order.query.filter(Order.user_id == current_user.id, Order.order_date.between(start_date, end_date)).all()
     existing_orders = {order.order_date: order for order in orders_query}
     return render_template('selection_template.html', weekly_menu=weekly_menu, week_dates=week_dates, existing_orders=existing_orders, employee=current_user, title=f"Tus Pedidos de la Semana, {current_user.name}", save_url=url_for('save_week'))
 
-def process_week_selection(user_id):
-    week_dates = get_active_week()
+# --- ESCRITURA DE PEDIDOS SEMANALES ---
+def dialect_insert(table):
+    # INSERT del dialecto activo, con soporte de upsert (ON CONFLICT en PostgreSQL/SQLite, ON DUPLICATE KEY en MySQL)
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql': return mysql.insert(table)
+    if dialect == 'postgresql': return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def upsert_rows(table, rows, key_columns, update_values):
+    # update_values recibe las columnas de la fila entrante (excluded / inserted) y devuelve {columna: expresión}
+    if not rows: return
+    stmt = dialect_insert(table).values(rows)
+    if db.engine.dialect.name == 'mysql': stmt = stmt.on_duplicate_key_update(**update_values(stmt.inserted))
+    else: stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=update_values(stmt.excluded))
+    db.session.execute(stmt)
+
+def upsert_orders(rows):
+    # Inserta o actualiza en un solo statement los pedidos, resolviendo el conflicto sobre _user_date_uc
+    upsert_rows(Order.__table__, rows, ['user_id', 'order_date'], lambda incoming: {'menu_id': incoming.menu_id, 'meal_type': incoming.meal_type})
+
+def lock_users(user_ids):
+    # Serializa hasta el commit las escrituras sobre los pedidos de estos usuarios, para que el diff no parta de una lectura vieja.
+    # PostgreSQL/MySQL: bloqueo de filas de user en orden de id. SQLite no tiene bloqueo por fila: BEGIN IMMEDIATE toma el lock de escritura.
+    if db.engine.dialect.name == 'sqlite':
+        if not db.session.connection().connection.driver_connection.in_transaction: db.session.execute(text('BEGIN IMMEDIATE'))
+    else: db.session.execute(select(User.id).where(User.id.in_(sorted(user_ids))).order_by(User.id).with_for_update())
+
+def apply_meal_count_deltas(changes):
+    # changes: (fecha, anterior, nuevo) con (menu_id, meal_type) o None; los Franco no tienen plato y no se cuentan
+    deltas = Counter()
+    for day, old, new in changes:
+        if old and old[0] is not None: deltas[(day, old[0], old[1])] -= 1
+        if new and new[0] is not None: deltas[(day, new[0], new[1])] += 1
+    increment_meal_counts(deltas)
+
+def bump_date_versions(dates, batch_size=1000):
+    # Incremento atómico del sello de cada fecha tocada; en orden para que dos transacciones no se bloqueen cruzadas
+    rows = [{'stamp_date': day, 'version': 1} for day in sorted(set(dates))]
+    for i in range(0, len(rows), batch_size): upsert_rows(DateVersion.__table__, rows[i:i + batch_size], ['stamp_date'], lambda incoming: {'version': DateVersion.__table__.c.version + 1})
+
+def increment_meal_counts(deltas, batch_size=1000):
+    # deltas: Counter {(fecha, menu_id, meal_type): incremento}
+    # Ordenadas por clave, igual que en bump_date_versions: dos guardados que cruzan platos toman los contadores en el mismo orden
+    rows = [{'count_date': day, 'menu_id': menu_id, 'meal_type': meal_type, 'total': delta} for (day, menu_id, meal_type), delta in sorted(deltas.items()) if delta]
+    for i in range(0, len(rows), batch_size): upsert_rows(MealCount.__table__, rows[i:i + batch_size], ['count_date', 'menu_id', 'meal_type'], lambda incoming: {'total': MealCount.__table__.c.total + incoming.total})
+
+def save_week_orders(selections, week_dates, partial=False):
+    """Aplica {user_id: {fecha: (menu_id, meal_type)}} sobre la semana; un día ausente significa 'sin pedido'.
+    Con partial=True sólo se tocan los días presentes en el dict (None = 'sin pedido') y el resto queda como está en la base.
+    Bloquea a los usuarios, carga la semana existente en una sola consulta, calcula la diferencia y escribe sólo lo que cambió.
+    Devuelve la lista de cambios (user_id, fecha, anterior, nuevo). No hace commit."""
+    if not selections: return []
+    start_date, end_date = week_dates[0], week_dates[-1]; lock_users(selections)
+    existing_query = db.session.query(Order.user_id, Order.order_date, Order.menu_id, Order.meal_type).filter(Order.user_id.in_(list(selections)), Order.order_date.between(start_date, end_date))
+    existing = {(row.user_id, row.order_date): (row.menu_id, row.meal_type) for row in existing_query}
+    changes = []; upserts = []; deletes = []
+    for user_id, days in selections.items():
+        for day in (days if partial else week_dates):
+            old, new = existing.get((user_id, day)), days.get(day)
+            if old == new: continue
+            changes.append((user_id, day, old, new))
+            if new is None: deletes.append((user_id, day))
+            else: upserts.append({'user_id': user_id, 'order_date': day, 'menu_id': new[0], 'meal_type': new[1]})
+    upsert_orders(upserts)
+    if deletes: db.session.execute(delete(Order).where(tuple_(Order.user_id, Order.order_date).in_(deletes)))
+    apply_meal_count_deltas((day, old, new) for _, day, old, new in changes); bump_date_versions(day for _, day, _, _ in changes)
+    return changes
+
+def parse_week_form(form, week_dates):
+    selection = {}
     for day in week_dates:
-        day_str = day.isoformat(); selection_type = request.form.get(f'selection_type-{day_str}'); existing_order = Order.query.filter_by(user_id=user_id, order_date=day).first()
-        if selection_type == 'franco':
-            if existing_order: existing_order.menu_id = None; existing_order.meal_type = 'Franco'
-            else: db.session.add(Order(user_id=user_id, menu_id=None, order_date=day, meal_type='Franco'))
+        day_str = day.isoformat(); selection_type = form.get(f'selection_type-{day_str}')
+        if selection_type == 'franco': selection[day] = (None, 'Franco')
         elif selection_type == 'pedido':
-            selected_dish_id = request.form.get(f'dish-{day_str}'); selected_meal_type = request.form.get(f'meal_type-{day_str}')
-            if selected_dish_id and selected_meal_type:
-                if existing_order: existing_order.menu_id = int(selected_dish_id); existing_order.meal_type = selected_meal_type
-                else: db.session.add(Order(user_id=user_id, menu_id=int(selected_dish_id), order_date=day, meal_type=selected_meal_type))
-            elif existing_order: db.session.delete(existing_order)
-        else:
-            if existing_order: db.session.delete(existing_order)
-    db.session.commit()
+            selected_dish_id = form.get(f'dish-{day_str}'); selected_meal_type = form.get(f'meal_type-{day_str}')
+            if selected_dish_id and selected_meal_type: selection[day] = (int(selected_dish_id), selected_meal_type)
+    return selection
+
+def process_week_selection(user_id):
+    week_dates = get_active_week()
+    if save_week_orders({user_id: parse_week_form(request.form, week_dates)}, week_dates): db.session.commit()
 
 @app.route('/save_week', methods=['POST'])
 @login_required
@@ -163,9 +429,7 @@ def manager_select_meals(employee_id):
     if current_user.role != 'encargado': return redirect(url_for('index'))
     employee = User.query.get_or_404(employee_id)
     if employee.sector != current_user.sector: flash('Acceso no autorizado.'); return redirect(url_for('manager_dashboard'))
-    week_dates = get_active_week(); start_date, end_date = week_dates[0], week_dates[-1]
-    menus_query = Menu.query.filter(Menu.menu_date.between(start_date, end_date)).all()
-    weekly_menu = {day: [m for m in menus_query if m.menu_date == day] for day in week_dates}
+    week_dates = get_active_week(); start_date, end_date = week_dates[0], week_dates[-1]; weekly_menu = get_weekly_menu(week_dates)
     orders_query = Order.query.filter(Order.user_id == employee.id, Order.order_date.between(start_date, end_date)).all()
     existing_orders = {order.order_date: order for order in orders_query}
     return render_template('selection_template.html', weekly_menu=weekly_menu, week_dates=week_dates, existing_orders=existing_orders, employee=employee, title=f"Pedidos para {employee.name}", save_url=url_for('save_employee_week', employee_id=employee.id))
@@ -178,6 +442,55 @@ def save_employee_week(employee_id):
     if employee.sector != current_user.sector: flash('Acceso no autorizado.'); return redirect(url_for('manager_dashboard'))
     process_week_selection(employee_id); flash(f'Selecciones para {employee.name} guardadas.'); return redirect(url_for('manager_select_meals', employee_id=employee.id))
 
+# Grilla semanal del sector: empleados x días, cargada con un solo join y guardada en una sola transacción
+MEAL_TYPES = ('Almuerzo', 'Cena')
+
+def grid_cell_value(menu_id, meal_type):
+    if meal_type == 'Franco': return 'franco'
+    return f'{menu_id}:{meal_type}' if menu_id else ''
+
+def parse_grid_cell(value, valid_menu_ids):
+    # Devuelve (menu_id, meal_type), None si la celda queda sin pedido, o lanza ValueError si el valor no es válido para ese día
+    if not value: return None
+    if value == 'franco': return (None, 'Franco')
+    menu_id, _, meal_type = value.partition(':')
+    if not menu_id.isdigit() or int(menu_id) not in valid_menu_ids or meal_type not in MEAL_TYPES: raise ValueError(value)
+    return (int(menu_id), meal_type)
+
+@app.route('/manager/grid')
+@login_required
+def manager_grid():
+    if current_user.role != 'encargado': return redirect(url_for('index'))
+    week_dates = get_active_week(); weekly_menu = get_weekly_menu(week_dates)
+    rows = db.session.query(User.id, User.name, Order.order_date, Order.menu_id, Order.meal_type).outerjoin(Order, (Order.user_id == User.id) & Order.order_date.between(week_dates[0], week_dates[-1])).filter(User.sector == current_user.sector, User.role == 'empleado').order_by(User.name, User.id)
+    employees = []; cells = {}
+    for (employee_id, name), employee_rows in groupby(rows, key=lambda row: (row.id, row.name)):
+        employees.append((employee_id, name))
+        for row in employee_rows:
+            if row.order_date: cells[(employee_id, row.order_date)] = grid_cell_value(row.menu_id, row.meal_type)
+    return render_template('manager_grid.html', employees=employees, cells=cells, week_dates=week_dates, weekly_menu=weekly_menu, meal_types=MEAL_TYPES, type_codes=EXCEL_TYPE_CODES)
+
+@app.route('/manager/save_grid', methods=['POST'])
+@login_required
+def manager_save_grid():
+    if current_user.role != 'encargado': return redirect(url_for('index'))
+    week_dates = get_active_week(); weekly_menu = get_weekly_menu(week_dates); valid_menu_ids = {day: {item.id for item in weekly_menu[day]} for day in week_dates}
+    sector_ids = {employee_id for (employee_id,) in db.session.query(User.id).filter(User.sector == current_user.sector, User.role == 'empleado')}
+    submitted_ids = {int(value) for value in request.form.getlist('employee_id') if value.isdigit()}
+    if submitted_ids - sector_ids: flash('Acceso no autorizado.'); return redirect(url_for('manager_grid'))
+    selections = {}
+    try:
+        for employee_id in submitted_ids:
+            # Sólo las celdas que el encargado cambió respecto de lo que cargó: lo que el empleado guardó mientras tanto no se pisa
+            for day in week_dates:
+                value = request.form.get(f'cell-{employee_id}-{day.isoformat()}', ''); original = request.form.get(f'orig-{employee_id}-{day.isoformat()}', value)
+                if value != original: selections.setdefault(employee_id, {})[day] = parse_grid_cell(value, valid_menu_ids[day])
+    except ValueError:
+        flash('La grilla contiene un plato que ya no está en el menú; recarga la página e intenta de nuevo.'); return redirect(url_for('manager_grid'))
+    changes = save_week_orders(selections, week_dates, partial=True)
+    if changes: db.session.commit()
+    flash(f'Grilla del sector guardada: {len(changes)} cambios.'); return redirect(url_for('manager_grid'))
+
 @app.route('/manager/personnel')
 @login_required
 def manager_personnel():
@@ -194,7 +507,7 @@ def add_employee():
         if User.query.filter_by(email=email).first(): flash('El email ya está en uso.'); return redirect(url_for('add_employee'))
         if legajo and User.query.filter_by(legajo=legajo).first(): flash('El número de legajo ya está en uso.'); return redirect(url_for('add_employee'))
         new_user = User(name=name, email=email, legajo=legajo, sector=current_user.sector, role='empleado'); new_user.set_password(password)
-        db.session.add(new_user); db.session.commit(); flash(f'Empleado {name} agregado con éxito.'); return redirect(url_for('manager_personnel'))
+        db.session.add(new_user); bump_personnel_version(); db.session.commit(); flash(f'Empleado {name} agregado con éxito.'); return redirect(url_for('manager_personnel'))
     return render_template('manager_employee_form.html', title="Agregar Empleado", employee=None)
 
 @app.route('/manager/edit_employee/<int:employee_id>', methods=['GET', 'POST'])
@@ -211,7 +524,7 @@ def edit_employee(employee_id):
             flash('El nuevo legajo ya está en uso por otro usuario.'); return render_template('manager_employee_form.html', title="Editar Empleado", employee=employee)
         employee.name = request.form.get('name'); employee.email = new_email; employee.legajo = new_legajo; password = request.form.get('password')
         if password: employee.set_password(password)
-        db.session.commit(); flash(f'Empleado {employee.name} actualizado.'); return redirect(url_for('manager_personnel'))
+        bump_personnel_version(); db.session.commit(); identity_cache.invalidate(employee.id); flash(f'Empleado {employee.name} actualizado.'); return redirect(url_for('manager_personnel'))
     return render_template('manager_employee_form.html', title="Editar Empleado", employee=employee)
 
 @app.route('/manager/delete_employee/<int:employee_id>', methods=['POST'])
@@ -220,69 +533,366 @@ def delete_employee(employee_id):
     if current_user.role != 'encargado': return redirect(url_for('index'))
     employee = User.query.get_or_404(employee_id)
     if employee.sector != current_user.sector: flash('Acceso no autorizado.'); return redirect(url_for('manager_personnel'))
-    flash(f'Empleado {employee.name} eliminado.'); db.session.delete(employee); db.session.commit(); return redirect(url_for('manager_personnel'))
+    lock_users([employee_id]); apply_meal_count_deltas((order.order_date, (order.menu_id, order.meal_type), None) for order in employee.orders); bump_date_versions(order.order_date for order in employee.orders); bump_personnel_version()
+    flash(f'Empleado {employee.name} eliminado.'); db.session.delete(employee); db.session.commit(); identity_cache.invalidate(employee_id); return redirect(url_for('manager_personnel'))
+
+# --- IMPORTACIÓN MASIVA DE EMPLEADOS ---
+IMPORT_MAX_ROWS = 5000
+IMPORT_BATCH_SIZE = 500
+IMPORT_EMPLOYEE_COLUMNS = {'nombre': 'name', 'name': 'name', 'email': 'email', 'correo': 'email', 'legajo': 'legajo', 'contrasena': 'password', 'password': 'password', 'sector': 'sector'}
+
+def _normalize_header(value):
+    return unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode().strip().lower()
+
+def _cell_text(value):
+    # openpyxl devuelve los legajos numéricos como int o float y las fechas como datetime
+    if isinstance(value, float) and value.is_integer(): value = int(value)
+    if isinstance(value, datetime): value = value.date()
+    if isinstance(value, date): return value.isoformat()
+    return str(value).strip() if value is not None else ''
+
+def read_employee_rows(fileobj, filename):
+    return read_spreadsheet_rows(fileobj, filename, IMPORT_EMPLOYEE_COLUMNS, {'name', 'email', 'password'})
+
+def read_spreadsheet_rows(fileobj, filename, column_names, required):
+    """Lee una planilla .xlsx (openpyxl read-only) o un .csv y devuelve [(número de fila, {campo: texto})].
+    column_names traduce los encabezados (sin acentos, en minúsculas) a los campos internos."""
+    if filename.lower().endswith('.xlsx'):
+        # Un archivo dañado o que no es realmente .xlsx se reporta como error de validación, no como 500
+        try:
+            wb = load_workbook(fileobj, read_only=True, data_only=True)
+            try: raw_rows = [tuple(row) for row in wb.worksheets[0].iter_rows(values_only=True, max_row=IMPORT_MAX_ROWS + 2)]
+            finally: wb.close()
+        except (zipfile.BadZipFile, InvalidFileException, KeyError, IndexError): raise ValueError('El archivo .xlsx no es válido.')
+    elif filename.lower().endswith('.csv'):
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''); sample = text.read(4096); text.seek(0)
+        try: dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error: dialect = csv.excel
+        raw_rows = [tuple(row) for _, row in zip(range(IMPORT_MAX_ROWS + 2), csv.reader(text, dialect))]
+    else: raise ValueError('El archivo debe ser .xlsx o .csv.')
+    if not raw_rows: raise ValueError('El archivo está vacío.')
+    columns = [column_names.get(_normalize_header(header)) for header in raw_rows[0]]
+    missing = set(required) - set(columns)
+    if missing: raise ValueError('Faltan columnas obligatorias: ' + ', '.join(sorted(missing)) + '.')
+    # Encabezado + hasta IMPORT_MAX_ROWS filas de datos; se lee una fila de más sólo para detectar el exceso
+    if len(raw_rows) - 1 > IMPORT_MAX_ROWS: raise ValueError(f'El archivo supera el máximo de {IMPORT_MAX_ROWS} filas por importación.')
+    rows = []
+    for row_number, raw in enumerate(raw_rows[1:], start=2):
+        values = {column: _cell_text(value) for column, value in zip(columns, raw) if column}
+        if any(values.values()): rows.append((row_number, values))
+    return rows
+
+def hash_passwords(passwords):
+    # generate_password_hash es deliberadamente costoso: con muchos empleados se reparte entre procesos
+    if len(passwords) < 8: return [generate_password_hash(password) for password in passwords]
+    workers = max(1, app.config['IMPORT_HASH_WORKERS'])
+    # Sin fork: copiar a mitad de request un worker con hilos puede heredar locks tomados (logging, pool de conexiones)
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method)) as executor:
+        return list(executor.map(generate_password_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+def import_employees(rows, default_sector=None, force_sector=False):
+    """Valida e inserta empleados en una sola transacción. Devuelve (cantidad creada, [(fila, email, error)])."""
+    errors = []; valid = []; seen_emails = set(); seen_legajos = set()
+    for row_number, values in rows:
+        email = values.get('email', ''); legajo = values.get('legajo') or None; sector = default_sector if force_sector else (values.get('sector') or default_sector)
+        if not values.get('name') or not email or not values.get('password'): errors.append((row_number, email, 'Faltan nombre, email o contraseña.')); continue
+        if not sector: errors.append((row_number, email, 'Falta el sector.')); continue
+        if len(values['name']) > 100 or len(email) > 100 or len(legajo or '') > 20 or len(sector) > 50: errors.append((row_number, email[:100], 'El nombre, email, legajo o sector son demasiado largos.')); continue
+        if email in seen_emails: errors.append((row_number, email, 'Email repetido en el archivo.')); continue
+        if legajo and legajo in seen_legajos: errors.append((row_number, email, f'Legajo {legajo} repetido en el archivo.')); continue
+        seen_emails.add(email)
+        if legajo: seen_legajos.add(legajo)
+        valid.append((row_number, {'name': values['name'], 'email': email, 'legajo': legajo, 'sector': sector, 'role': 'empleado'}, values['password']))
+    if not valid: return 0, errors
+    # Una sola consulta contra la base para todos los emails y legajos del archivo
+    emails = [user['email'] for _, user, _ in valid]; legajos = [user['legajo'] for _, user, _ in valid if user['legajo']]
+    taken = db.session.query(User.email, User.legajo).filter(or_(User.email.in_(emails), User.legajo.in_(legajos))).all()
+    taken_emails = {email for email, _ in taken}; taken_legajos = {legajo for _, legajo in taken if legajo}
+    to_insert = []
+    for row_number, user, password in valid:
+        if user['email'] in taken_emails: errors.append((row_number, user['email'], 'El email ya está en uso.'))
+        elif user['legajo'] in taken_legajos: errors.append((row_number, user['email'], f"El legajo {user['legajo']} ya está en uso."))
+        else: to_insert.append((user, password))
+    errors.sort(key=lambda error: error[0])
+    if not to_insert: return 0, errors
+    for (user, _), password_hash in zip(to_insert, hash_passwords([password for _, password in to_insert])): user['password_hash'] = password_hash
+    try:
+        for i in range(0, len(to_insert), IMPORT_BATCH_SIZE): db.session.execute(User.__table__.insert(), [user for user, _ in to_insert[i:i + IMPORT_BATCH_SIZE]])
+        bump_personnel_version(); db.session.commit()
+    except IntegrityError:
+        # Otro usuario dio de alta el mismo email o legajo mientras se importaba
+        db.session.rollback(); return 0, errors + [(None, '', 'Conflicto con datos cargados en simultáneo; no se importó ningún empleado. Reintentar.')]
+    return len(to_insert), errors
+
+@app.route('/manager/import_employees', methods=['GET', 'POST'])
+@login_required
+def import_employees_view():
+    if current_user.role != 'encargado': return redirect(url_for('index'))
+    created = None; errors = []
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename: flash('Selecciona un archivo .xlsx o .csv.'); return redirect(url_for('import_employees_view'))
+        try: rows = read_employee_rows(upload.stream, upload.filename)
+        except ValueError as e: flash(str(e)); return redirect(url_for('import_employees_view'))
+        created, errors = import_employees(rows, default_sector=current_user.sector, force_sector=True)
+        flash(f'Se importaron {created} empleados.' + (f' {len(errors)} filas con errores.' if errors else ''))
+    return render_template('manager_import_employees.html', created=created, errors=errors)
+
+# --- VERSIONES DE REPORTES Y GET CONDICIONAL ---
+def report_version(start_date, end_date=None):
+    """Sello del contenido de un reporte: sellos de cada fecha del rango más data_version (semana y menú) y personnel_version."""
+    end_date = end_date or start_date
+    versions = dict(db.session.query(DateVersion.stamp_date, DateVersion.version).filter(DateVersion.stamp_date.between(start_date, end_date)).all())
+    stamps = ','.join(str(versions.get(start_date + timedelta(days=i), 0)) for i in range((end_date - start_date).days + 1))
+    return hashlib.sha1(f"{start_date}|{end_date}|{stamps}|{get_data_version()}|{get_personnel_version()}".encode()).hexdigest()[:20]
+
+def conditional_page(etag, render):
+    # Devuelve 304 si el navegador ya tiene esta versión. Con mensajes flash pendientes se renderiza sin ETag para no cachearlos.
+    if '_flashes' in session: return render()
+    response = Response(status=304) if request.if_none_match.contains(etag) else make_response(render())
+    response.set_etag(etag); response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/admin/report')
 @app.route('/admin/report/<report_date_str>')
 @login_required
 def admin_dashboard(report_date_str=None):
-    if not current_user.is_admin: return redirect(url_for('index')); week_dates = get_active_week(); report_date = date.fromisoformat(report_date_str) if report_date_str else week_dates[0]
-    orders_query = db.session.query(Order, User, Menu).join(User, Order.user_id == User.id).outerjoin(Menu, Order.menu_id == Menu.id).filter(Order.order_date == report_date).order_by(User.sector, User.name).all()
-    return render_template('admin.html', orders=orders_query, report_date=report_date, week_dates=week_dates)
+    if not current_user.is_admin: return redirect(url_for('index'))
+    week_dates = get_active_week(); report_date = date.fromisoformat(report_date_str) if report_date_str else week_dates[0]
+    def render():
+        # Las semanas se archivan completas: si la fecha no tiene pedidos en Order se busca en order_archive (sólo lectura)
+        for table in (Order, OrderArchive):
+            orders_query = db.session.query(table, User, Menu).join(User, table.user_id == User.id).outerjoin(Menu, table.menu_id == Menu.id).filter(table.order_date == report_date).order_by(User.sector, User.name).all()
+            if orders_query: break
+        return render_template('admin.html', orders=orders_query, archived=table is OrderArchive and bool(orders_query), report_date=report_date, week_dates=week_dates)
+    return conditional_page(f"report-{report_version(report_date)}-{current_user.id}", render)
 
 @app.route('/admin/summary')
 @app.route('/admin/summary/<report_date_str>')
 @login_required
 def admin_summary(report_date_str=None):
-    if not current_user.is_admin: return redirect(url_for('index')); week_dates = get_active_week(); report_date = date.fromisoformat(report_date_str) if report_date_str else week_dates[0]
-    def get_summary(meal_type): return db.session.query(Menu.menu_type, Menu.description, func.count(Order.id).label('total')).join(Order).filter(Order.order_date == report_date, Order.meal_type == meal_type).group_by(Menu.menu_type, Menu.description).order_by(func.count(Order.id).desc()).all()
-    lunch_summary = get_summary('Almuerzo'); dinner_summary = get_summary('Cena'); total_lunch = sum(item.total for item in lunch_summary); total_dinner = sum(item.total for item in dinner_summary)
-    return render_template('admin_summary.html', lunch_summary=lunch_summary, dinner_summary=dinner_summary, total_lunch=total_lunch, total_dinner=total_dinner, report_date=report_date, week_dates=week_dates)
+    if not current_user.is_admin: return redirect(url_for('index'))
+    week_dates = get_active_week(); report_date = date.fromisoformat(report_date_str) if report_date_str else week_dates[0]
+    def render():
+        summary_query = db.session.query(MealCount.meal_type, Menu.menu_type, Menu.description, func.sum(MealCount.total).label('total')).join(Menu, MealCount.menu_id == Menu.id).filter(MealCount.count_date == report_date, MealCount.total > 0).group_by(MealCount.meal_type, Menu.menu_type, Menu.description).order_by(func.sum(MealCount.total).desc()).all()
+        lunch_summary = [item for item in summary_query if item.meal_type == 'Almuerzo']; dinner_summary = [item for item in summary_query if item.meal_type == 'Cena']; total_lunch = sum(item.total for item in lunch_summary); total_dinner = sum(item.total for item in dinner_summary)
+        return render_template('admin_summary.html', lunch_summary=lunch_summary, dinner_summary=dinner_summary, total_lunch=total_lunch, total_dinner=total_dinner, report_date=report_date, week_dates=week_dates)
+    return conditional_page(f"summary-{report_version(report_date)}-{current_user.id}", render)
+
+@app.route('/admin/forecast')
+@login_required
+def admin_forecast():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    week_dates = get_active_week(); weekly_menu = get_weekly_menu(week_dates)
+    counts_query = db.session.query(MealCount.count_date, MealCount.menu_id, MealCount.meal_type, MealCount.total).filter(MealCount.count_date.between(week_dates[0], week_dates[-1]), MealCount.total > 0)
+    counts = {(row.menu_id, row.meal_type): row.total for row in counts_query}; day_totals = Counter()
+    for day in week_dates:
+        for item in weekly_menu[day]:
+            for meal_type in ('Almuerzo', 'Cena'): day_totals[(day, meal_type)] += counts.get((item.id, meal_type), 0)
+    menu_types = sorted({item.menu_type for items in weekly_menu.values() for item in items})
+    dishes = {(day, item.menu_type): item for day in week_dates for item in weekly_menu[day]}
+    return render_template('admin_forecast.html', week_dates=week_dates, menu_types=menu_types, dishes=dishes, counts=counts, day_totals=day_totals)
 
 @app.route('/admin/edit_order/<int:order_id>', methods=['GET', 'POST'])
 @login_required
 def admin_edit_order(order_id):
-    if not current_user.is_admin: return redirect(url_for('index')); order = Order.query.get_or_404(order_id); available_dishes = Menu.query.filter_by(menu_date=order.order_date).all()
+    if not current_user.is_admin: return redirect(url_for('index'))
+    order = Order.query.get_or_404(order_id); available_dishes = Menu.query.filter_by(menu_date=order.order_date).all()
     if request.method == 'POST':
-        selection_type = request.form.get('selection_type')
+        lock_users([order.user_id]); db.session.refresh(order); selection_type = request.form.get('selection_type'); previous = (order.menu_id, order.meal_type)
         if selection_type == 'franco': order.menu_id = None; order.meal_type = 'Franco'
         elif selection_type == 'pedido':
             menu_id = request.form.get('dish'); meal_type = request.form.get('meal_type')
             if not menu_id or not meal_type: flash('Si selecciona "Pedido", debe elegir un plato y un tipo de comida.', 'danger'); return redirect(url_for('admin_edit_order', order_id=order_id))
             order.menu_id = int(menu_id); order.meal_type = meal_type
-        db.session.commit(); flash(f'El pedido para {order.user.name} ha sido actualizado.', 'success')
+        apply_meal_count_deltas([(order.order_date, previous, (order.menu_id, order.meal_type))]); bump_date_versions([order.order_date]); db.session.commit(); flash(f'El pedido para {order.user.name} ha sido actualizado.', 'success')
         return redirect(url_for('admin_dashboard', report_date_str=order.order_date.isoformat()))
     return render_template('admin_edit_order.html', order=order, available_dishes=available_dishes)
 
-@app.route('/export_excel/<report_date_str>')
-@login_required
-def export_excel(report_date_str):
-    if not current_user.is_admin: return redirect(url_for('index')); report_date = date.fromisoformat(report_date_str)
-    query_results = db.session.query(User, Order, Menu).select_from(User).outerjoin(Order, (User.id == Order.user_id) & (Order.order_date == report_date)).outerjoin(Menu, Order.menu_id == Menu.id).filter(User.role == 'empleado').order_by(User.sector, User.name).all()
-    wb = Workbook(); ws = wb.active; ws.title = f"Reporte {report_date_str}"
-    font_bold = Font(bold=True); font_sector = Font(bold=True, size=14); font_header = Font(name='Calibri', size=11, bold=True); font_data = Font(name='Calibri', size=10); alignment_center_wrap = Alignment(horizontal='center', vertical='center', wrap_text=True); thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    type_mapping = {"Clásico": "C", "Ensalada": "E", "Tradicional": "T", "Regional": "R", "Sin Gluten": "SG", "Vegetariano": "V", "Ejecutivo Saludable": "ES", "Postre": "P", "Dieta": "D"}
-    current_row = 1; current_sector = None
-    for user, order, menu in query_results:
-        if user.sector != current_sector:
-            if current_row > 1: current_row += 2
-            ws.cell(row=current_row, column=1, value=f"SECTOR: {user.sector.upper()}").font = font_sector; ws.cell(row=current_row, column=8, value=f"FECHA: {report_date.strftime('%d/%m/%Y')}").font = font_bold; current_row += 2
-            headers = ['Empleado', 'Legajo', 'Tipo', 'Estado', 'Turno', 'Hora de ingreso', 'Hora de egreso', 'Firma del Empleado', 'Firma del referente']
-            for i, header in enumerate(headers, 1):
-                cell = ws.cell(row=current_row, column=i, value=header); cell.font = font_header; cell.border = thin_border; cell.alignment = alignment_center_wrap
-            current_sector = user.sector; current_row += 1
+# --- EXPORTACIÓN A EXCEL ---
+# El libro se arma en modo write-only: cada fila se vuelca a disco al escribirse, con estilos con nombre compartidos por todas las celdas.
+# Cada versión generada queda en una caché en disco acotada por tamaño (EXCEL_CACHE_DIR / EXCEL_CACHE_MAX_BYTES).
+EXCEL_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXCEL_MAX_DAYS = 31
+# Versión del formato del libro: subirla al cambiar encabezados, estilos o disposición, para que la caché en disco
+# (que sobrevive a los deploys) y los navegadores no sigan sirviendo archivos con el formato anterior
+EXCEL_FORMAT_VERSION = 1
+EXCEL_HEADERS = ['Empleado', 'Legajo', 'Tipo', 'Estado', 'Turno', 'Hora de ingreso', 'Hora de egreso', 'Firma del Empleado', 'Firma del referente']
+EXCEL_COLUMN_WIDTHS = {'A': 30, 'B': 10, 'C': 8, 'D': 12, 'E': 12, 'F': 15, 'G': 15, 'H': 25, 'I': 25}
+EXCEL_TYPE_CODES = {"Clásico": "C", "Ensalada": "E", "Tradicional": "T", "Regional": "R", "Sin Gluten": "SG", "Vegetariano": "V", "Ejecutivo Saludable": "ES", "Postre": "P", "Dieta": "D"}
+
+def new_report_workbook():
+    wb = Workbook(write_only=True); thin = Side(style='thin'); thin_border = Border(left=thin, right=thin, top=thin, bottom=thin); alignment_center_wrap = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    wb.add_named_style(NamedStyle(name='reporte_sector', font=Font(bold=True, size=14))); wb.add_named_style(NamedStyle(name='reporte_fecha', font=Font(bold=True)))
+    wb.add_named_style(NamedStyle(name='reporte_encabezado', font=Font(name='Calibri', size=11, bold=True), border=thin_border, alignment=alignment_center_wrap))
+    wb.add_named_style(NamedStyle(name='reporte_dato', font=Font(name='Calibri', size=10), border=thin_border, alignment=alignment_center_wrap))
+    return wb
+
+class ReportSheet:
+    """Hoja de un día del reporte. Las filas deben llegar ordenadas por sector y nombre."""
+    def __init__(self, wb, report_date):
+        self.ws = wb.create_sheet(f"Reporte {report_date.isoformat()}"); self.report_date = report_date; self.rows_written = 0; self.current_sector = None
+        for column, width in EXCEL_COLUMN_WIDTHS.items(): self.ws.column_dimensions[column].width = width
+        self.ws.page_setup.orientation = Worksheet.ORIENTATION_LANDSCAPE; self.ws.page_setup.paperSize = Worksheet.PAPERSIZE_A4; self.ws.page_setup.fitToPage = True; self.ws.page_setup.fitToWidth = 1; self.ws.page_setup.fitToHeight = 0
+
+    def _cell(self, value, style):
+        cell = WriteOnlyCell(self.ws, value=value); cell.style = style; return cell
+
+    def _append(self, values, height=None):
+        self.rows_written += 1
+        if height: self.ws.row_dimensions[self.rows_written].height = height
+        self.ws.append(values)
+
+    def add_employee(self, employee, order):
+        if employee.sector != self.current_sector:
+            if self.rows_written: self._append([]); self._append([])
+            self._append([self._cell(f"SECTOR: {(employee.sector or '').upper()}", 'reporte_sector')] + [None] * 6 + [self._cell(f"FECHA: {self.report_date.strftime('%d/%m/%Y')}", 'reporte_fecha')]); self._append([])
+            self._append([self._cell(header, 'reporte_encabezado') for header in EXCEL_HEADERS]); self.current_sector = employee.sector
         tipo_code = ''; estado = 'Sin Pedido'
         if order:
             estado = order.meal_type
-            if order.meal_type != 'Franco' and menu: tipo_code = type_mapping.get(menu.menu_type, '?')
-        data_row = [user.name, user.legajo or '', tipo_code, estado, '', '', '', '', '']
-        for i, value in enumerate(data_row, 1):
-            cell = ws.cell(row=current_row, column=i, value=value); cell.border = thin_border; cell.font = font_data; cell.alignment = alignment_center_wrap
-        ws.row_dimensions[current_row].height = 40; current_row += 1
-    ws.column_dimensions['A'].width = 30; ws.column_dimensions['B'].width = 10; ws.column_dimensions['C'].width = 8; ws.column_dimensions['D'].width = 12; ws.column_dimensions['E'].width = 12; ws.column_dimensions['F'].width = 15; ws.column_dimensions['G'].width = 15; ws.column_dimensions['H'].width = 25; ws.column_dimensions['I'].width = 25
-    ws.page_setup.orientation = ws.ORIENTATION_LANDSCAPE; ws.page_setup.paperSize = ws.PAPERSIZE_A4; ws.page_setup.fitToPage = True; ws.page_setup.fitToWidth = 1; ws.page_setup.fitToHeight = 0 
-    in_memory_fp = io.BytesIO(); wb.save(in_memory_fp); in_memory_fp.seek(0) 
-    return Response(in_memory_fp, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-disposition": f"attachment; filename=Reporte_Viandas_{report_date_str}.xlsx"})
+            if order.meal_type != 'Franco' and order.menu_type: tipo_code = EXCEL_TYPE_CODES.get(order.menu_type, '?')
+        self._append([self._cell(value, 'reporte_dato') for value in [employee.name, employee.legajo or '', tipo_code, estado, '', '', '', '', '']], height=40)
+
+def write_report_workbook(start_date, end_date, fileobj):
+    # Una sola consulta para todo el rango: cada empleado llega con todos sus pedidos y se reparte en la hoja de cada día
+    report_days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    wb = new_report_workbook(); sheets = {day: ReportSheet(wb, day) for day in report_days}
+    # Pedidos vigentes y archivados del rango, como en el export CSV/NDJSON
+    orders = union_all(*(select(table.user_id, table.order_date, table.meal_type, table.menu_id).where(table.order_date.between(start_date, end_date)) for table in (Order, OrderArchive))).subquery()
+    query = db.session.query(User.id.label('user_id'), User.name, User.legajo, User.sector, orders.c.order_date, orders.c.meal_type, Menu.menu_type).select_from(User).outerjoin(orders, User.id == orders.c.user_id).outerjoin(Menu, orders.c.menu_id == Menu.id).filter(User.role == 'empleado').order_by(User.sector, User.name, User.id)
+    for _, employee_rows in groupby(query.yield_per(1000), key=lambda row: row.user_id):
+        employee_rows = list(employee_rows); orders_by_day = {row.order_date: row for row in employee_rows if row.order_date}
+        for day, sheet in sheets.items(): sheet.add_employee(employee_rows[0], orders_by_day.get(day))
+    wb.save(fileobj)
+
+def cached_report_path(start_date, end_date, version):
+    """Devuelve la ruta del .xlsx para (rango, versión), generándolo si no está en la caché en disco."""
+    cache_dir = app.config['EXCEL_CACHE_DIR']; os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"reporte_{start_date.isoformat()}_{end_date.isoformat()}_{version}.xlsx")
+    if os.path.exists(path): os.utime(path); return path
+    # Se escribe en un temporal del mismo directorio y se renombra: otro worker nunca ve un archivo a medio escribir
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fileobj: write_report_workbook(start_date, end_date, fileobj)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+    trim_report_cache(keep=path)
+    return path
+
+def trim_report_cache(keep=None):
+    # Borra los reportes usados hace más tiempo hasta quedar bajo EXCEL_CACHE_MAX_BYTES
+    entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in os.scandir(app.config['EXCEL_CACHE_DIR']) if entry.name.endswith('.xlsx'))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= app.config['EXCEL_CACHE_MAX_BYTES']: break
+        if path == keep: continue
+        try: os.remove(path); total -= size
+        except FileNotFoundError: pass
+
+@app.route('/export_excel/<report_date_str>')
+@app.route('/export_excel/<report_date_str>/<end_date_str>')
+@login_required
+def export_excel(report_date_str, end_date_str=None):
+    if not current_user.is_admin: return redirect(url_for('index'))
+    start_date = date.fromisoformat(report_date_str); end_date = date.fromisoformat(end_date_str) if end_date_str else start_date
+    if end_date < start_date or (end_date - start_date).days >= EXCEL_MAX_DAYS:
+        flash(f'El rango del reporte debe ser de 1 a {EXCEL_MAX_DAYS} días.'); return redirect(url_for('admin_dashboard', report_date_str=report_date_str))
+    version = f"{report_version(start_date, end_date)}-f{EXCEL_FORMAT_VERSION}"
+    if request.if_none_match.contains(version): response = Response(status=304); response.set_etag(version); return response
+    filename = f"Reporte_Viandas_{report_date_str}.xlsx" if start_date == end_date else f"Reporte_Viandas_{report_date_str}_a_{end_date_str}.xlsx"
+    # send_file envía el archivo por partes desde disco; una versión ya generada no vuelve a pasar por openpyxl ni por la base
+    response = send_file(cached_report_path(start_date, end_date, version), mimetype=EXCEL_MIMETYPE, as_attachment=True, download_name=filename, etag=version, max_age=0)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# --- EXPORTACIÓN DE PEDIDOS EN CSV / NDJSON ---
+ORDER_EXPORT_FIELDS = ['fecha', 'legajo', 'empleado', 'email', 'sector', 'estado', 'tipo_plato', 'plato']
+ORDER_EXPORT_MIMETYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+def order_export_query(start_date, end_date, sector=None):
+    # Incluye los pedidos archivados: un rango de payroll puede cruzar el horizonte de archivo
+    selects = []
+    for table in (Order, OrderArchive):
+        statement = select(table.order_date, User.legajo, User.name, User.email, User.sector, table.meal_type, Menu.menu_type, Menu.description).join(User, table.user_id == User.id).outerjoin(Menu, table.menu_id == Menu.id).where(table.order_date.between(start_date, end_date))
+        selects.append(statement.where(User.sector == sector) if sector else statement)
+    combined = union_all(*selects).subquery()
+    # Cursor del lado del servidor: las filas llegan en tandas y la memoria no crece con el rango
+    return db.session.execute(select(combined).order_by(combined.c.order_date, combined.c.sector, combined.c.name).execution_options(stream_results=True, yield_per=1000))
+
+def export_line_renderer(fields, output_format):
+    # Devuelve (encabezado o None, render) para escribir una fila por línea en CSV o NDJSON
+    if output_format == 'csv':
+        buffer = io.StringIO(); writer = csv.writer(buffer)
+        def render(values): buffer.seek(0); buffer.truncate(); writer.writerow(values); return buffer.getvalue()
+        return render(fields), render
+    return None, lambda values: json.dumps(dict(zip(fields, values)), ensure_ascii=False) + '\n'
+
+def iter_order_export(start_date, end_date, sector=None, output_format='csv'):
+    """Genera el export por partes: una línea de texto por pedido, precedida por el encabezado en CSV."""
+    header, render = export_line_renderer(ORDER_EXPORT_FIELDS, output_format)
+    if header: yield header
+    for row in order_export_query(start_date, end_date, sector):
+        yield render([row.order_date.isoformat(), row.legajo or '', row.name, row.email, row.sector or '', row.meal_type, row.menu_type or '', row.description or ''])
+
+@app.route('/admin/export_orders')
+@login_required
+def export_orders():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    output_format = request.args.get('format', 'csv'); sector = request.args.get('sector') or None
+    try: start_date = date.fromisoformat(request.args.get('start', '')); end_date = date.fromisoformat(request.args.get('end', ''))
+    except ValueError: return Response('Parámetros start y end requeridos en formato AAAA-MM-DD.\n', status=400, mimetype='text/plain')
+    if output_format not in ORDER_EXPORT_MIMETYPES or end_date < start_date: return Response('Formato o rango de fechas inválido.\n', status=400, mimetype='text/plain')
+    filename = f"Pedidos_{start_date.isoformat()}_a_{end_date.isoformat()}.{output_format}"
+    return Response(stream_with_context(iter_order_export(start_date, end_date, sector, output_format)), mimetype=ORDER_EXPORT_MIMETYPES[output_format], headers={"Content-disposition": f"attachment; filename={filename}"})
+
+# Totales semanales por empleado: las semanas archivadas salen del resumen order_week_rollup, las vigentes se agregan desde Order
+WEEKLY_TOTALS_FIELDS = ['semana', 'legajo', 'empleado', 'sector', 'almuerzos', 'cenas', 'francos']
+ROLLUP_MEAL_TYPES = (('almuerzos', 'Almuerzo'), ('cenas', 'Cena'), ('francos', 'Franco'))
+
+def meal_type_sums(table):
+    # Cantidad de pedidos de cada tipo, con los nombres de columna de OrderWeekRollup
+    return [func.sum(case((table.meal_type == meal_type, 1), else_=0)).label(name) for name, meal_type in ROLLUP_MEAL_TYPES]
+
+def week_monday(day): return day - timedelta(days=day.weekday())
+
+def iter_weekly_totals(start_date, end_date, sector=None, output_format='csv'):
+    """Genera los totales por empleado de cada semana (de lunes a domingo) que toca el rango, ordenados por semana, sector y nombre."""
+    first_week, last_week = week_monday(start_date), week_monday(end_date); totals = {}
+    def add(week_start, user_id, counts):
+        current = totals.setdefault((week_start, user_id), [0, 0, 0])
+        for i, count in enumerate(counts): current[i] += count or 0
+    for row in db.session.query(OrderWeekRollup).filter(OrderWeekRollup.week_start.between(first_week, last_week)): add(row.week_start, row.user_id, (row.almuerzos, row.cenas, row.francos))
+    # Los pedidos vigentes están acotados por el horizonte de archivo; se agrupan por día en la base y por semana acá
+    for row in db.session.query(Order.user_id, Order.order_date, *meal_type_sums(Order)).filter(Order.order_date.between(first_week, last_week + timedelta(days=6))).group_by(Order.user_id, Order.order_date): add(week_monday(row.order_date), row.user_id, (row.almuerzos, row.cenas, row.francos))
+    users_query = db.session.query(User.id, User.legajo, User.name, User.sector)
+    users = {user.id: user for user in (users_query.filter(User.sector == sector) if sector else users_query)}
+    header, render = export_line_renderer(WEEKLY_TOTALS_FIELDS, output_format)
+    if header: yield header
+    # Como en el export de pedidos, los empleados dados de baja no se listan
+    for (week_start, user_id), counts in sorted(((key, counts) for key, counts in totals.items() if key[1] in users), key=lambda item: (item[0][0], users[item[0][1]].sector or '', users[item[0][1]].name)):
+        user = users[user_id]; yield render([week_start.isoformat(), user.legajo or '', user.name, user.sector or '', *counts])
+
+@app.route('/admin/export_weekly_totals')
+@login_required
+def export_weekly_totals():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    output_format = request.args.get('format', 'csv'); sector = request.args.get('sector') or None
+    try: start_date = date.fromisoformat(request.args.get('start', '')); end_date = date.fromisoformat(request.args.get('end', ''))
+    except ValueError: return Response('Parámetros start y end requeridos en formato AAAA-MM-DD.\n', status=400, mimetype='text/plain')
+    if output_format not in ORDER_EXPORT_MIMETYPES or end_date < start_date: return Response('Formato o rango de fechas inválido.\n', status=400, mimetype='text/plain')
+    filename = f"Totales_Semanales_{start_date.isoformat()}_a_{end_date.isoformat()}.{output_format}"
+    return Response(stream_with_context(iter_weekly_totals(start_date, end_date, sector, output_format)), mimetype=ORDER_EXPORT_MIMETYPES[output_format], headers={"Content-disposition": f"attachment; filename={filename}"})
+
+@app.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    with _endpoint_metrics_lock: endpoints = {endpoint: metrics.as_dict() for endpoint, metrics in sorted(endpoint_metrics.items())}
+    return jsonify({'enabled': app.config['PERF_METRICS_ENABLED'], 'worker_pid': os.getpid(), 'since': _metrics_started_at, 'endpoints': endpoints})
 
 @app.route('/admin/settings', methods=['GET', 'POST'])
 @login_required
@@ -290,40 +900,198 @@ def admin_settings():
     if not current_user.is_admin: return redirect(url_for('index'));
     if request.method == 'POST':
         setting = SystemSetting.query.get('week_start_date'); start_date_str = request.form.get('week_start_date')
+        try: start_date = date.fromisoformat(start_date_str or '')
+        except ValueError: flash('La fecha de inicio no es válida.', 'danger'); return redirect(url_for('admin_settings'))
+        # La semana activa no puede caer en semanas ya archivadas: los pedidos nuevos quedarían en Order junto a los de order_archive
+        last_archived = db.session.query(func.max(OrderArchive.order_date)).scalar()
+        if last_archived and start_date <= last_archived: flash(f'Las semanas hasta el {last_archived.strftime("%d/%m/%Y")} están archivadas; elige una fecha de inicio posterior.', 'danger'); return redirect(url_for('admin_settings'))
         if setting: setting.value = start_date_str
         else: db.session.add(SystemSetting(key='week_start_date', value=start_date_str))
-        db.session.commit(); flash('La fecha de inicio de la semana ha sido actualizada.'); return redirect(url_for('admin_settings'))
+        bump_data_version(); db.session.commit(); flash('La fecha de inicio de la semana ha sido actualizada.'); return redirect(url_for('admin_settings'))
     current_setting = SystemSetting.query.get('week_start_date'); return render_template('admin_settings.html', current_setting=current_setting)
 
 @app.route('/admin/manage_menu')
 @login_required
 def admin_manage_menu():
     if not current_user.is_admin: return redirect(url_for('index'))
-    week_dates = get_active_week(); start_date, end_date = week_dates[0], week_dates[-1]; menus_query = Menu.query.filter(Menu.menu_date.between(start_date, end_date)).order_by(Menu.menu_type).all()
-    grouped_menus = {day: [] for day in week_dates}
-    for menu in menus_query:
-        if menu.menu_date in grouped_menus: grouped_menus[menu.menu_date].append(menu)
+    week_dates = get_active_week(); grouped_menus = {day: sorted(menus, key=lambda menu: menu.menu_type) for day, menus in get_weekly_menu(week_dates).items()}
     return render_template('admin_manage_menu.html', grouped_menus=grouped_menus, week_dates=week_dates)
 
+# --- CARGA MASIVA Y CLONADO DE MENÚS ---
+IMPORT_MENU_COLUMNS = {'fecha': 'menu_date', 'date': 'menu_date', 'tipo': 'menu_type', 'tipo de plato': 'menu_type', 'type': 'menu_type', 'descripcion': 'description', 'plato': 'description', 'description': 'description'}
+
+def _parse_menu_date(text):
+    try: return date.fromisoformat(text[:10])
+    except ValueError: return datetime.strptime(text, '%d/%m/%Y').date()
+
+def import_menu_rows(rows):
+    """Carga los platos de la planilla en una sola transacción. Un (fecha, tipo) ya existente se actualiza
+    en lugar de duplicarse, para no romper los pedidos que lo referencian. Devuelve (insertados, actualizados, errores);
+    si hay errores no se guarda nada."""
+    errors = []; items = {}
+    for row_number, values in rows:
+        try: menu_date = _parse_menu_date(values.get('menu_date', ''))
+        except ValueError: errors.append((row_number, f"Fecha inválida: '{values.get('menu_date', '')}'.")); continue
+        menu_type = values.get('menu_type', ''); description = values.get('description', '')
+        if not menu_type or not description: errors.append((row_number, 'Faltan el tipo o la descripción del plato.')); continue
+        if len(menu_type) > 50 or len(description) > 200: errors.append((row_number, 'El tipo o la descripción son demasiado largos.')); continue
+        if (menu_date, menu_type) in items: errors.append((row_number, f'{menu_type} del {menu_date.isoformat()} está repetido en el archivo.')); continue
+        items[(menu_date, menu_type)] = description
+    if errors or not items: return 0, 0, errors
+    dates = {menu_date for menu_date, _ in items}
+    existing = {(menu.menu_date, menu.menu_type): menu.id for menu in db.session.query(Menu.id, Menu.menu_date, Menu.menu_type).filter(Menu.menu_date.between(min(dates), max(dates)))}
+    updates = [{'id': existing[key], 'description': description} for key, description in items.items() if key in existing]
+    inserts = [{'menu_date': menu_date, 'menu_type': menu_type, 'description': description} for (menu_date, menu_type), description in items.items() if (menu_date, menu_type) not in existing]
+    for i in range(0, len(inserts), IMPORT_BATCH_SIZE): db.session.execute(Menu.__table__.insert(), inserts[i:i + IMPORT_BATCH_SIZE])
+    if updates: db.session.execute(update(Menu), updates)
+    bump_date_versions(dates); bump_data_version(); db.session.commit()
+    return len(inserts), len(updates), []
+
+def shifted_date(column, days):
+    # menu_date + days, en la sintaxis de cada motor
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite': return func.date(column, f'{days:+d} days')
+    if dialect == 'mysql': return func.adddate(column, days)
+    return column + literal(days, Integer)
+
+def clone_menu_week(source_start, target_start, activate=False):
+    """Copia los menús de la semana que empieza en source_start a la que empieza en target_start con un único INSERT ... SELECT.
+    Con activate=True cambia la semana activa en la misma transacción. Devuelve la cantidad de platos copiados."""
+    source_end = source_start + timedelta(days=6); target_end = target_start + timedelta(days=6)
+    if source_start == target_start: raise ValueError('La semana de destino debe ser distinta de la de origen.')
+    if db.session.query(Menu.id).filter(Menu.menu_date.between(target_start, target_end)).first(): raise ValueError(f'La semana del {target_start.isoformat()} ya tiene menú cargado.')
+    offset = (target_start - source_start).days
+    copied = db.session.execute(Menu.__table__.insert().from_select(['menu_date', 'menu_type', 'description'], select(shifted_date(Menu.menu_date, offset), Menu.menu_type, Menu.description).where(Menu.menu_date.between(source_start, source_end)))).rowcount
+    if not copied: db.session.rollback(); raise ValueError(f'La semana del {source_start.isoformat()} no tiene menú para copiar.')
+    if activate:
+        setting = db.session.get(SystemSetting, 'week_start_date')
+        if setting: setting.value = target_start.isoformat()
+        else: db.session.add(SystemSetting(key='week_start_date', value=target_start.isoformat()))
+    bump_date_versions(target_start + timedelta(days=i) for i in range(7)); bump_data_version(); db.session.commit()
+    return copied
+
+@app.route('/admin/import_menu', methods=['POST'])
+@login_required
+def admin_import_menu():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    upload = request.files.get('file')
+    if not upload or not upload.filename: flash('Selecciona un archivo .xlsx o .csv.'); return redirect(url_for('admin_manage_menu'))
+    try: rows = read_spreadsheet_rows(upload.stream, upload.filename, IMPORT_MENU_COLUMNS, {'menu_date', 'menu_type', 'description'})
+    except ValueError as e: flash(str(e)); return redirect(url_for('admin_manage_menu'))
+    inserted, updated, errors = import_menu_rows(rows)
+    if errors: flash('No se importó el menú. ' + ' '.join(f'Fila {row_number}: {message}' for row_number, message in errors[:5]) + (f' (y {len(errors) - 5} errores más)' if len(errors) > 5 else ''))
+    else: flash(f'Menú importado: {inserted} platos nuevos y {updated} actualizados.')
+    return redirect(url_for('admin_manage_menu'))
+
+@app.route('/admin/clone_week', methods=['POST'])
+@login_required
+def admin_clone_week():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    try: source_start = date.fromisoformat(request.form.get('source_start', '')); target_start = date.fromisoformat(request.form.get('target_start', ''))
+    except ValueError: flash('Fechas inválidas.'); return redirect(url_for('admin_manage_menu'))
+    try: copied = clone_menu_week(source_start, target_start, activate=bool(request.form.get('activate')))
+    except ValueError as e: flash(str(e)); return redirect(url_for('admin_manage_menu'))
+    flash(f'Se copiaron {copied} platos a la semana del {target_start.isoformat()}.'); return redirect(url_for('admin_manage_menu'))
+
 @app.route('/admin/edit_menu_item/<int:menu_id>', methods=['GET', 'POST'])
 @login_required
 def admin_edit_menu_item(menu_id):
     if not current_user.is_admin: return redirect(url_for('index'))
     menu_item = Menu.query.get_or_404(menu_id)
     if request.method == 'POST':
-        menu_item.description = request.form.get('description'); menu_item.menu_type = request.form.get('menu_type'); db.session.commit()
+        menu_item.description = request.form.get('description'); menu_item.menu_type = request.form.get('menu_type'); bump_date_versions([menu_item.menu_date]); bump_data_version(); db.session.commit()
         flash('El plato ha sido actualizado con éxito.'); return redirect(url_for('admin_manage_menu'))
     return render_template('admin_edit_menu_item.html', menu_item=menu_item)
 
+@app.cli.command("import-employees")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--sector', default=None, help='Sector para las filas que no tengan la columna sector.')
+def import_employees_command(path, sector):
+    """Importa empleados desde una planilla .xlsx o .csv de RRHH."""
+    with open(path, 'rb') as fileobj:
+        try: rows = read_employee_rows(fileobj, path)
+        except ValueError as e: raise click.ClickException(str(e))
+    created, errors = import_employees(rows, default_sector=sector)
+    for row_number, email, message in errors: print(f"Fila {row_number or '-'} {email}: {message}")
+    print(f"{created} empleados importados, {len(errors)} filas con errores.")
+
+@app.cli.command("export-orders")
+@click.option('--start', 'start_str', required=True, help='Fecha inicial (AAAA-MM-DD).')
+@click.option('--end', 'end_str', required=True, help='Fecha final inclusive (AAAA-MM-DD).')
+@click.option('--sector', default=None, help='Filtrar por sector.')
+@click.option('--format', 'output_format', type=click.Choice(sorted(ORDER_EXPORT_MIMETYPES)), default='csv', show_default=True)
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='Archivo de salida (por defecto, stdout).')
+def export_orders_command(start_str, end_str, sector, output_format, output):
+    """Exporta los pedidos de un rango de fechas en CSV o NDJSON, fila por fila."""
+    try: start_date = date.fromisoformat(start_str)
+    except ValueError: raise click.BadParameter('usar el formato AAAA-MM-DD.', param_hint='--start')
+    try: end_date = date.fromisoformat(end_str)
+    except ValueError: raise click.BadParameter('usar el formato AAAA-MM-DD.', param_hint='--end')
+    if end_date < start_date: raise click.BadParameter('no puede ser anterior a --start.', param_hint='--end')
+    for line in iter_order_export(start_date, end_date, sector, output_format): output.write(line)
+
+@app.cli.command("import-menu")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_menu_command(path):
+    """Importa platos desde una planilla .xlsx o .csv con columnas Fecha, Tipo y Descripción."""
+    with open(path, 'rb') as fileobj:
+        try: rows = read_spreadsheet_rows(fileobj, path, IMPORT_MENU_COLUMNS, {'menu_date', 'menu_type', 'description'})
+        except ValueError as e: raise click.ClickException(str(e))
+    inserted, updated, errors = import_menu_rows(rows)
+    for row_number, message in errors: print(f"Fila {row_number}: {message}")
+    if errors: raise click.ClickException(f"{len(errors)} filas con errores; no se importó nada.")
+    print(f"{inserted} platos nuevos, {updated} actualizados.")
+
+@app.cli.command("clone-week")
+@click.option('--from', 'source_str', required=True, help='Lunes de la semana a copiar (AAAA-MM-DD).')
+@click.option('--to', 'target_str', required=True, help='Lunes de la semana nueva (AAAA-MM-DD).')
+@click.option('--activate', is_flag=True, help='Marcar la semana nueva como activa en la misma transacción.')
+def clone_week_command(source_str, target_str, activate):
+    """Copia el menú de una semana a otra fecha de inicio."""
+    try: copied = clone_menu_week(date.fromisoformat(source_str), date.fromisoformat(target_str), activate=activate)
+    except ValueError as e: raise click.ClickException(str(e))
+    print(f"{copied} platos copiados a la semana del {target_str}." + (" Semana activada." if activate else ""))
+
+@app.cli.command("archive-orders")
+@click.option('--days', type=int, default=None, help='Antigüedad mínima en días de los pedidos a archivar (por defecto ARCHIVE_HORIZON_DAYS).')
+@click.option('--dry-run', is_flag=True, help='Sólo muestra qué semanas se archivarían.')
+def archive_orders_command(days, dry_run):
+    """Mueve a order_archive los pedidos de semanas completas más viejas que el horizonte y deja un resumen por empleado y semana."""
+    days = app.config['ARCHIVE_HORIZON_DAYS'] if days is None else days
+    if days < 7: raise click.BadParameter('el horizonte debe ser de al menos 7 días.', param_hint='--days')
+    # Nunca la semana activa ni las posteriores, aunque la semana activa haya quedado atrás en el calendario
+    cutoff = min(date.today() - timedelta(days=days), get_active_week()[0])
+    cutoff = week_monday(cutoff)  # sólo semanas completas, de lunes a domingo
+    oldest = db.session.query(func.min(Order.order_date)).filter(Order.order_date < cutoff).scalar()
+    if oldest is None: print(f"No hay pedidos anteriores al {cutoff.isoformat()}."); return
+    week_start = week_monday(oldest); archived = 0
+    columns = ['user_id', 'menu_id', 'order_date', 'meal_type']
+    while week_start < cutoff:
+        week_end = week_start + timedelta(days=6); in_week = Order.order_date.between(week_start, week_end)
+        rollups = db.session.query(Order.user_id, *meal_type_sums(Order)).filter(in_week).group_by(Order.user_id).all()
+        if rollups and dry_run: print(f"Semana del {week_start.isoformat()}: {sum(row.almuerzos + row.cenas + row.francos for row in rollups)} pedidos de {len(rollups)} empleados.")
+        elif rollups:
+            # Una transacción por semana: resumen, copia al archivo y borrado de la tabla caliente
+            rows = [{'user_id': row.user_id, 'week_start': week_start, 'almuerzos': row.almuerzos, 'cenas': row.cenas, 'francos': row.francos} for row in rollups]
+            for i in range(0, len(rows), IMPORT_BATCH_SIZE): upsert_rows(OrderWeekRollup.__table__, rows[i:i + IMPORT_BATCH_SIZE], ['user_id', 'week_start'], lambda incoming: {name: getattr(OrderWeekRollup.__table__.c, name) + getattr(incoming, name) for name in ('almuerzos', 'cenas', 'francos')})
+            db.session.execute(OrderArchive.__table__.insert().from_select(columns, select(*(getattr(Order, name) for name in columns)).where(in_week)))
+            moved = db.session.execute(delete(Order).where(in_week)).rowcount
+            bump_date_versions(week_start + timedelta(days=i) for i in range(7)); db.session.commit(); archived += moved
+            print(f"Semana del {week_start.isoformat()}: {moved} pedidos archivados.")
+        week_start += timedelta(days=7)
+    if not dry_run: print(f"{archived} pedidos archivados (anteriores al {cutoff.isoformat()}).")
+
+SECTORES = [ "Administración", "MKT", "ATC", "Cajas", "Gastronomia", "Limpieza", "Mantenimiento", "Monitoreo", "RRHH", "Sala", "Seguridad", "Sistemas", "Slot", "Tesoreria", "Cardenales S.A.S" ]
+
 @app.cli.command("init-db")
 def init_db_command():
     db.drop_all(); db.create_all()
     EMAIL_DOMAIN = "tudominio.com"
     db.session.add(SystemSetting(key='week_start_date', value='2025-06-23'))
+    db.session.add(SystemSetting(key=DATA_VERSION_KEY, value=uuid.uuid4().hex)); db.session.add(SystemSetting(key=PERSONNEL_VERSION_KEY, value=uuid.uuid4().hex))
     admin_user = User(name='Super Admin', email=f"admin@{EMAIL_DOMAIN}", role='admin', sector='Gerencia', legajo='001'); admin_user.set_password('admin123')
     db.session.add(admin_user)
-    sectores = [ "Administración", "MKT", "ATC", "Cajas", "Gastronomia", "Limpieza", "Mantenimiento", "Monitoreo", "RRHH", "Sala", "Seguridad", "Sistemas", "Slot", "Tesoreria", "Cardenales S.A.S" ]
-    for sector in sectores:
+    for sector in SECTORES:
         email_sector = sector.lower(); replacements = {'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u', ' ': '', '.': ''};
         for old, new in replacements.items(): email_sector = email_sector.replace(old, new)
         encargado = User(name=f"Encargado {sector}", email=f"encargado.{email_sector}@{EMAIL_DOMAIN}", role='encargado', sector=sector); encargado.set_password('encargado123')
@@ -336,4 +1104,160 @@ def init_db_command():
     for day, menus in menu_data.items():
         for menu_item in menus: db.session.add(Menu(menu_date=day, menu_type=menu_item["type"], description=menu_item["desc"]))
     db.session.commit()
-    print(f"Base de datos inicializada con el dominio de email: {EMAIL_DOMAIN}")
\ No newline at end of file
+    print(f"Base de datos inicializada con el dominio de email: {EMAIL_DOMAIN}")
+
+@app.cli.command("upgrade-db")
+def upgrade_db_command():
+    """Crea las tablas e índices nuevos en una base existente (PostgreSQL, MySQL o SQLite) sin tocar los datos."""
+    db.create_all()
+    # create_all no agrega índices a tablas que ya existían; checkfirst los crea sólo si faltan
+    for table in db.metadata.sorted_tables:
+        for index in sorted(table.indexes, key=lambda index: index.name): index.create(bind=db.engine, checkfirst=True); print(f"Índice {index.name} verificado.")
+    print("Tablas creadas. Si es la primera vez que existe meal_count, ejecutar 'flask rebuild-meal-counts'.")
+
+@app.cli.command("rebuild-meal-counts")
+@click.option('--check', is_flag=True, help='Sólo compara los contadores con los pedidos, sin reescribirlos.')
+def rebuild_meal_counts_command(check):
+    """Recalcula la tabla meal_count desde Order y OrderArchive y reporta las diferencias encontradas."""
+    # Los pedidos archivados siguen contando: meal_count conserva el historial completo
+    expected = Counter()
+    for table in (Order, OrderArchive):
+        for row in db.session.query(table.order_date, table.menu_id, table.meal_type, func.count(table.id).label('total')).filter(table.menu_id.isnot(None)).group_by(table.order_date, table.menu_id, table.meal_type): expected[(row.order_date, row.menu_id, row.meal_type)] += row.total
+    stored = {(row.count_date, row.menu_id, row.meal_type): row.total for row in db.session.query(MealCount).filter(MealCount.total != 0)}
+    mismatches = sorted((key, stored.get(key, 0), expected.get(key, 0)) for key in expected.keys() | stored.keys() if stored.get(key, 0) != expected.get(key, 0))
+    for (count_date, menu_id, meal_type), stored_total, expected_total in mismatches[:50]: print(f"{count_date} plato {menu_id} {meal_type}: contador {stored_total}, pedidos {expected_total}")
+    print(f"{len(mismatches)} diferencias en {len(expected)} combinaciones de fecha/plato/turno.")
+    if check:
+        if mismatches: raise SystemExit(1)
+        return
+    db.session.execute(delete(MealCount))
+    if expected: db.session.execute(MealCount.__table__.insert(), [{'count_date': count_date, 'menu_id': menu_id, 'meal_type': meal_type, 'total': total} for (count_date, menu_id, meal_type), total in expected.items()])
+    # Los resúmenes cacheados de las fechas corregidas (ETag de admin_summary) tienen que invalidarse
+    bump_date_versions(count_date for (count_date, _, _), _, _ in mismatches); db.session.commit(); print("Contadores reconstruidos.")
+
+# --- DATOS DE CARGA Y BENCHMARK ---
+SEED_EMAIL_DOMAIN = "carga.local"
+SEED_WEEKEND_SKIPPED_TYPES = ("Regional", "Sin Gluten")
+
+@app.cli.command("seed-load")
+@click.option('--employees-per-sector', type=click.IntRange(min=1), default=50, show_default=True, help='Empleados a generar en cada sector.')
+@click.option('--weeks', type=click.IntRange(min=1), default=52, show_default=True, help='Semanas de menús y pedidos hasta la semana activa inclusive.')
+@click.option('--franco-ratio', default=0.15, show_default=True, help='Proporción de días marcados como Franco.')
+@click.option('--no-order-ratio', default=0.10, show_default=True, help='Proporción de días sin pedido.')
+@click.option('--dinner-ratio', default=0.35, show_default=True, help='Proporción de pedidos que son Cena.')
+@click.option('--seed', default=42, show_default=True, help='Semilla del generador aleatorio.')
+@click.option('--password', default='carga123', show_default=True, help='Contraseña de todos los usuarios generados.')
+def seed_load_command(employees_per_sector, weeks, franco_ratio, no_order_ratio, dinner_ratio, seed, password):
+    """Genera un volumen realista de usuarios, menús y pedidos para pruebas de carga."""
+    if User.query.filter(User.email.like(f"%@{SEED_EMAIL_DOMAIN}")).first(): raise click.ClickException(f"Ya existen usuarios de carga (@{SEED_EMAIL_DOMAIN}); usar una base nueva.")
+    rng = random.Random(seed); password_hash = generate_password_hash(password); batch_size = 5000
+    # Usuarios: un admin, un encargado por sector y los empleados, con un único hash de contraseña compartido
+    users = [{'name': 'Admin Carga', 'email': f"admin@{SEED_EMAIL_DOMAIN}", 'role': 'admin', 'sector': 'Gerencia', 'legajo': 'C-ADMIN', 'password_hash': password_hash}]
+    for sector_index, sector in enumerate(SECTORES):
+        users.append({'name': f"Encargado Carga {sector}", 'email': f"encargado.{sector_index}@{SEED_EMAIL_DOMAIN}", 'role': 'encargado', 'sector': sector, 'legajo': None, 'password_hash': password_hash})
+        users.extend({'name': f"Empleado {sector_index:02d}-{i:05d}", 'email': f"empleado.{sector_index}.{i}@{SEED_EMAIL_DOMAIN}", 'role': 'empleado', 'sector': sector, 'legajo': f"C{sector_index:02d}{i:05d}", 'password_hash': password_hash} for i in range(employees_per_sector))
+    for i in range(0, len(users), batch_size): db.session.execute(User.__table__.insert(), users[i:i + batch_size])
+    employee_ids = [row.id for row in db.session.query(User.id).filter(User.email.like(f"%@{SEED_EMAIL_DOMAIN}"), User.role == 'empleado')]
+    # Menús: sólo para los días que todavía no tienen
+    active_start = get_active_week()[0]; first_day = active_start - timedelta(weeks=weeks - 1); days = [first_day + timedelta(days=i) for i in range(weeks * 7)]
+    days_with_menu = {row.menu_date for row in db.session.query(Menu.menu_date).filter(Menu.menu_date.between(days[0], days[-1])).distinct()}
+    menus = [{'menu_date': day, 'menu_type': menu_type, 'description': f"PLATO {menu_type.upper()} {day.isoformat()}"} for day in days if day not in days_with_menu for menu_type in EXCEL_TYPE_CODES if day.isoweekday() < 6 or menu_type not in SEED_WEEKEND_SKIPPED_TYPES]
+    for i in range(0, len(menus), batch_size): db.session.execute(Menu.__table__.insert(), menus[i:i + batch_size])
+    menu_ids_by_day = {day: [] for day in days}
+    for row in db.session.query(Menu.id, Menu.menu_date).filter(Menu.menu_date.between(days[0], days[-1])): menu_ids_by_day[row.menu_date].append(row.id)
+    # Pedidos: mezcla de sin pedido / Franco / Almuerzo / Cena, con los contadores acumulados en memoria
+    orders = []; meal_counts = Counter(); total_orders = 0
+    for user_id in employee_ids:
+        for day in days:
+            roll = rng.random()
+            if roll < no_order_ratio: continue
+            if roll < no_order_ratio + franco_ratio or not menu_ids_by_day[day]: orders.append({'user_id': user_id, 'menu_id': None, 'order_date': day, 'meal_type': 'Franco'})
+            else:
+                menu_id = rng.choice(menu_ids_by_day[day]); meal_type = 'Cena' if rng.random() < dinner_ratio else 'Almuerzo'
+                orders.append({'user_id': user_id, 'menu_id': menu_id, 'order_date': day, 'meal_type': meal_type}); meal_counts[(day, menu_id, meal_type)] += 1
+            if len(orders) >= batch_size: db.session.execute(Order.__table__.insert(), orders); total_orders += len(orders); orders = []
+    if orders: db.session.execute(Order.__table__.insert(), orders); total_orders += len(orders)
+    increment_meal_counts(meal_counts); bump_date_versions(days); bump_data_version(); bump_personnel_version(); db.session.commit()
+    print(f"Generados {len(users)} usuarios ({len(employee_ids)} empleados), {len(menus)} platos y {total_orders} pedidos entre {days[0]} y {days[-1]}.")
+
+def percentile(sorted_values, pct):
+    # Percentil por rango más cercano sobre una lista ya ordenada
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+def bench_targets():
+    """Arma la lista de requests (nombre, rol, método, url, datos) usando datos existentes de la base."""
+    week_dates = get_active_week(); day = week_dates[0].isoformat()
+    employee = User.query.filter(User.role == 'empleado', User.sector.in_(db.session.query(User.sector).filter(User.role == 'encargado'))).order_by(User.id).first()
+    admin = User.query.filter_by(role='admin').order_by(User.id).first()
+    if not employee or not admin: raise click.ClickException("Faltan datos: ejecutar 'flask init-db' y 'flask seed-load' primero.")
+    manager = User.query.filter_by(role='encargado', sector=employee.sector).order_by(User.id).first()
+    order = Order.query.filter(Order.order_date.between(week_dates[0], week_dates[-1])).order_by(Order.id).first(); menu = Menu.query.filter(Menu.menu_date.between(week_dates[0], week_dates[-1])).order_by(Menu.id).first()
+    weekly_menu = get_weekly_menu(week_dates)
+    def week_form(meal_type): return {key: value for day in week_dates if weekly_menu[day] for key, value in ((f'selection_type-{day}', 'pedido'), (f'dish-{day}', weekly_menu[day][0].id), (f'meal_type-{day}', meal_type))}
+    # La grilla sólo guarda las celdas distintas de su valor original: se declara 'sin pedido' como original para que cada envío escriba
+    def grid_form(meal_type): return {'employee_id': [employee.id], **{key: value for day in week_dates if weekly_menu[day] for key, value in ((f'orig-{employee.id}-{day}', ''), (f'cell-{employee.id}-{day}', grid_cell_value(weekly_menu[day][0].id, meal_type)))}}
+    targets = [
+        ('GET /', employee, 'GET', '/', None),
+        ('GET /dashboard/empleado', employee, 'GET', url_for('employee_dashboard'), None),
+        ('POST /save_week', employee, 'POST', url_for('save_week'), [week_form('Almuerzo'), week_form('Cena')]),
+        ('GET /manager', manager, 'GET', url_for('manager_dashboard'), None),
+        ('GET /manager/select_meals/<id>', manager, 'GET', url_for('manager_select_meals', employee_id=employee.id), None),
+        ('POST /manager/save_employee_week/<id>', manager, 'POST', url_for('save_employee_week', employee_id=employee.id), [week_form('Cena'), week_form('Almuerzo')]),
+        ('GET /manager/grid', manager, 'GET', url_for('manager_grid'), None),
+        ('POST /manager/save_grid', manager, 'POST', url_for('manager_save_grid'), [grid_form('Almuerzo'), grid_form('Cena')]),
+        ('GET /manager/personnel', manager, 'GET', url_for('manager_personnel'), None),
+        ('GET /manager/import_employees', manager, 'GET', url_for('import_employees_view'), None),
+        ('GET /manager/edit_employee/<id>', manager, 'GET', url_for('edit_employee', employee_id=employee.id), None),
+        ('GET /admin/report/<date>', admin, 'GET', url_for('admin_dashboard', report_date_str=day), None),
+        ('GET /admin/summary/<date>', admin, 'GET', url_for('admin_summary', report_date_str=day), None),
+        ('GET /admin/forecast', admin, 'GET', url_for('admin_forecast'), None),
+        ('GET /admin/export_orders?format=csv', admin, 'GET', url_for('export_orders', start=day, end=week_dates[-1].isoformat(), format='csv'), None),
+        ('GET /admin/export_orders?format=ndjson', admin, 'GET', url_for('export_orders', start=day, end=week_dates[-1].isoformat(), format='ndjson'), None),
+        ('GET /admin/export_weekly_totals', admin, 'GET', url_for('export_weekly_totals', start=day, end=week_dates[-1].isoformat()), None),
+        ('GET /admin/metrics', admin, 'GET', url_for('admin_metrics'), None),
+        ('GET /export_excel/<date>', admin, 'GET', url_for('export_excel', report_date_str=day), None),
+        ('GET /export_excel/<start>/<end>', admin, 'GET', url_for('export_excel', report_date_str=day, end_date_str=week_dates[-1].isoformat()), None),
+        ('GET /admin/manage_menu', admin, 'GET', url_for('admin_manage_menu'), None),
+        ('GET /admin/settings', admin, 'GET', url_for('admin_settings'), None),
+    ]
+    if menu: targets.append(('GET /admin/edit_menu_item/<id>', admin, 'GET', url_for('admin_edit_menu_item', menu_id=menu.id), None))
+    if order: targets.append(('GET /admin/edit_order/<id>', admin, 'GET', url_for('admin_edit_order', order_id=order.id), None))
+    return [(name, user.id, method, url, data) for name, user, method, url, data in targets]
+
+@app.cli.command("bench")
+@click.option('--iterations', default=20, show_default=True, help='Requests medidos por ruta.')
+@click.option('--warmup', default=2, show_default=True, help='Requests previos no medidos por ruta.')
+@click.option('--route', 'route_filter', default=None, help='Medir sólo las rutas cuyo nombre contenga este texto.')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default=None, help='Archivo JSON de salida (por defecto, stdout).')
+def bench_command(iterations, warmup, route_filter, output):
+    """Recorre las rutas con el cliente de pruebas y reporta latencias p50/p95/p99, sentencias SQL y memoria pico en JSON."""
+    if db.engine.dialect.name != 'sqlite': raise click.ClickException("El benchmark escribe pedidos: ejecutarlo sólo contra una base SQLite local.")
+    with app.test_request_context(): targets = [target for target in bench_targets() if not route_filter or route_filter in target[0]]
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany): statements.append(statement)
+    results = {}
+    def run_targets():
+        for name, user_id, method, url, data in targets:
+            client = app.test_client()
+            with client.session_transaction() as session: session['_user_id'] = str(user_id); session['_fresh'] = True
+            def run(i): return client.open(url, method=method, data=data[i % len(data)] if data else None)
+            for i in range(warmup): run(i)
+            timings = []; statement_counts = []; status_codes = Counter()
+            for i in range(iterations):
+                statements.clear(); started = time.perf_counter(); response = run(i); response.get_data(); timings.append((time.perf_counter() - started) * 1000)
+                statement_counts.append(len(statements)); status_codes[response.status_code] += 1
+            # La memoria se mide en una request aparte: tracemalloc distorsiona las latencias
+            tracemalloc.start(); run(iterations).get_data(); peak_memory = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+            timings.sort()
+            results[name] = {'method': method, 'url': url, 'requests': iterations, 'status_codes': {str(code): count for code, count in status_codes.items()}, 'p50_ms': round(percentile(timings, 50), 3), 'p95_ms': round(percentile(timings, 95), 3), 'p99_ms': round(percentile(timings, 99), 3), 'mean_ms': round(sum(timings) / len(timings), 3), 'sql_statements_mean': round(sum(statement_counts) / len(statement_counts), 2), 'sql_statements_max': max(statement_counts), 'peak_memory_kb': round(peak_memory / 1024, 1)}
+    # Cada request necesita su propio app context (g, usuario de Flask-Login); el del comando CLI se compartiría entre todas
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    try: contextvars.Context().run(run_targets)
+    finally: event.remove(db.engine, 'before_cursor_execute', count_statement)
+    try: commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=app.root_path, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): commit = None
+    report = {'meta': {'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'iterations': iterations, 'warmup': warmup, 'dataset': {'users': User.query.count(), 'employees': User.query.filter_by(role='empleado').count(), 'menus': Menu.query.count(), 'orders': Order.query.count()}}, 'routes': results}
+    if output:
+        with open(output, 'w', encoding='utf-8') as fp: json.dump(report, fp, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {output}")
+    else: print(json.dumps(report, indent=2, ensure_ascii=False))